@@ -1,117 +1,291 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
 import streamlit as st
-import yfinance as yf
+from yfinance import Ticker, download
+from yfinance.exceptions import YFException
 import pandas as pd
 import numpy as np
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(layout="wide", page_title="Smart DCA Dashboard", page_icon="📈")
 
-# --- CUSTOM CSS FOR BADGES ONLY ---
+# --- CUSTOM CSS FOR BADGES & CARDS ---
 # We removed the metric background styling to fix the "Unreadable Text" issue.
+# Card colours are translucent or inherited so they read in light and dark mode.
 st.markdown("""
     <style>
     .badge-standard { background-color: #555; color: #fff; padding: 4px 8px; border-radius: 4px; font-size: 12px; }
     .badge-smart { background-color: #1C4E38; color: #2EE583; padding: 4px 8px; border-radius: 4px; font-size: 12px; }
     .badge-deep { background-color: #143528; color: #00FFA3; padding: 4px 8px; border-radius: 4px; font-size: 12px; border: 1px solid #00FFA3; }
     .badge-trim { background-color: #4A1A1A; color: #FF4B4B; padding: 4px 8px; border-radius: 4px; font-size: 12px; }
+    .card-grid { display: grid; grid-template-columns: repeat(4, minmax(0, 1fr)); gap: 16px; margin-bottom: 16px; }
+    @media (max-width: 640px) { .card-grid { grid-template-columns: minmax(0, 1fr); } }
+    .card { border: 1px solid rgba(128, 128, 128, 0.3); border-radius: 8px; padding: 16px; }
+    .card-header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 12px; }
+    .card-ticker { font-size: 24px; font-weight: 600; }
+    .card-label { font-size: 14px; opacity: 0.7; }
+    .card-price { font-size: 32px; line-height: 1.3; }
+    .card-up { color: #21C354; font-size: 14px; }
+    .card-down { color: #FF4B4B; font-size: 14px; }
+    .card-bar { background-color: rgba(128, 128, 128, 0.25); height: 8px; border-radius: 4px; margin: 4px 0 12px; }
+    .card-bar-fill { background-color: #2EE583; height: 100%; border-radius: 4px; }
+    .card-stats { display: flex; }
+    .card-stats > div { flex: 1; }
+    .card-action { padding: 12px 16px; border-radius: 8px; margin-top: 12px; }
+    .card-invest { background-color: rgba(33, 195, 84, 0.15); }
+    .card-hold { background-color: rgba(255, 189, 69, 0.15); }
     </style>
 """, unsafe_allow_html=True)
 
 # --- CONFIGURATION & INPUTS ---
 TICKERS = ['SPY', 'VT', 'TSLA', 'AAPL', 'MSFT', 'AMZN', 'NFLX', 'NVDA', 'PLTR', 'META', 'GOOGL']
 
-# --- DATA FETCHING FUNCTION ---
-@st.cache_data(ttl=3600)
-def get_market_data(tickers):
-    data = []
-    
-    # We fetch tickers one by one to avoid yfinance MultiIndex errors
-    # This is slightly slower but much more stable for a dashboard
-    for ticker in tickers:
-        try:
-            stock = yf.Ticker(ticker)
-            # Fetch 2 years of history
-            df = stock.history(period="2y")
-            
-            if df.empty:
+CACHE_DIR = Path(__file__).parent / ".cache"
+CACHE_VERSION = 3  # Bump when build_market_data's columns change
+MARKET_TZ = ZoneInfo("America/New_York")
+
+FETCH_WORKERS = 8   # Parallel requests when falling back to per-ticker fetches
+FETCH_TIMEOUT = 10  # Seconds to wait for the whole fallback batch before giving up
+
+# Errors a Yahoo request can raise: network failures (OSError), malformed or
+# missing payloads (ValueError/KeyError/TypeError/AttributeError from
+# yfinance's parsing) and yfinance's own exceptions
+FETCH_ERRORS = (OSError, ValueError, KeyError, TypeError, AttributeError, YFException)
+
+class MarketDataError(Exception):
+    pass
+
+# --- DATA FETCHING FUNCTIONS ---
+def _fetch_one(ticker):
+    return Ticker(ticker).history(period="2y")
+
+def fetch_history(tickers):
+    history = {}
+
+    # Fetch 2 years of history for every ticker in a single batched request.
+    # group_by='ticker' keeps the columns keyed by symbol (hist[ticker]) so
+    # the MultiIndex never has to be unpicked by hand.
+    try:
+        hist = download(tickers, period="2y", group_by='ticker', auto_adjust=True, threads=True, progress=False)
+        for ticker in tickers:
+            if ticker not in hist.columns.get_level_values(0):
                 continue
 
-            current_price = df['Close'].iloc[-1]
-            
-            # Calculate 200 Day Moving Average
-            if len(df) >= 200:
-                dma_200 = df['Close'].rolling(window=200).mean().iloc[-1]
-            else:
-                dma_200 = df['Close'].mean() # Fallback if new stock
-            
-            # Calculate Drawdown from 52-week High (approx 252 trading days)
-            year_high = df['Close'].tail(252).max()
-            drawdown = (current_price - year_high) / year_high
-            
-            # Determine Status & Multiplier based on Dashboard Rules
-            dma_diff_pct = (current_price - dma_200) / dma_200
-            
-            status = "Standard"
-            multiplier = 1.0
-            badge_class = "badge-standard"
-            
-            # Logic:
-            # 1. > 20% over 200 DMA -> Trim/Hold
-            # 2. < 200 DMA & Drawdown > 20% -> Deep Value
-            # 3. < 200 DMA -> Smart Buy
-            # 4. Otherwise -> Standard
-            
-            if current_price > dma_200 and dma_diff_pct > 0.20:
-                status = "Overextended"
-                multiplier = 0.0
-                badge_class = "badge-trim"
-            elif current_price < dma_200 and drawdown < -0.20:
-                status = "Deep Value Buy"
-                multiplier = 2.0
-                badge_class = "badge-deep"
-            elif current_price < dma_200:
-                status = "Smart Buy"
-                multiplier = 1.5
-                badge_class = "badge-smart"
-            
-            data.append({
-                "Ticker": ticker,
-                "Price": current_price,
-                "200_DMA": dma_200,
-                "DMA_Diff": dma_diff_pct,
-                "Drawdown": drawdown,
-                "Multiplier": multiplier,
-                "Status": status,
-                "Badge": badge_class
-            })
-            
-        except Exception as e:
-            # Silently skip errors to prevent app crashing
-            print(f"Error fetching {ticker}: {e}")
-            continue
-            
-    return pd.DataFrame(data)
+            # Dates are aligned across all tickers, so drop the padding rows
+            df = hist[ticker].dropna(subset=['Close'])
+            if not df.empty:
+                history[ticker] = df
+    except FETCH_ERRORS as e:
+        print(f"Batched download failed: {e}")
 
-# --- MAIN APP ---
-def main():
-    # Header Section
-    col1, col2 = st.columns([3, 1])
-    with col1:
-        st.title("Smart DCA Dashboard")
-        st.caption("Live Market Data via Yahoo Finance")
-    with col2:
-        if st.button("🔄 Refresh Data"):
-            st.cache_data.clear()
-            st.rerun()
+    # Anything the batch missed is retried one ticker at a time. Yahoo calls
+    # are I/O-bound, so threads overlap the network waits.
+    missing = [ticker for ticker in tickers if ticker not in history]
+    if missing:
+        executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+        futures = {executor.submit(_fetch_one, ticker): ticker for ticker in missing}
 
-    # Top Metrics
-    col_m1, col_m2 = st.columns(2)
-    with col_m1:
-        st.markdown("**Fear & Greed:** <span style='color:orange'>49 Neutral</span>", unsafe_allow_html=True)
-    with col_m2:
-        st.markdown("**Shiller PE:** <span style='color:red'>39.85 Overvalued</span>", unsafe_allow_html=True)
-    
-    st.divider()
+        try:
+            # One shared deadline, so a slow symbol cannot stall the page
+            for future in as_completed(futures, timeout=FETCH_TIMEOUT):
+                ticker = futures[future]
+                try:
+                    df = future.result()
+                except FETCH_ERRORS as e:
+                    # Skip the ticker rather than crash the app
+                    print(f"Error fetching {ticker}: {e}")
+                    continue
+
+                if not df.empty:
+                    history[ticker] = df
+        except FuturesTimeoutError:
+            pending = [ticker for future, ticker in futures.items() if not future.done()]
+            print(f"Timed out fetching {', '.join(pending)}")
+        finally:
+            # Don't let a request that timed out hold up the dashboard
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return history
+
+def build_market_data(tickers):
+    history = fetch_history(tickers)
+    symbols = [ticker for ticker in tickers if ticker in history]
+
+    if not symbols:
+        return pd.DataFrame()
+
+    # Stack every ticker's closes into one (T, N) panel aligned on the latest
+    # bar. Shorter histories are NaN-padded at the top, so the nan-aware
+    # reductions below only ever see each ticker's own trailing data.
+    # Only the trailing 252 bars are ever used, so nothing older is copied.
+    # float32 keeps ~7 significant digits, far more than cent precision on
+    # these prices, and halves the data the reductions have to stream.
+    lengths = [min(len(history[ticker]), 252) for ticker in symbols]
+    closes = np.full((max(lengths), len(symbols)), np.nan, dtype=np.float32)
+    for col, ticker in enumerate(symbols):
+        closes[-lengths[col]:, col] = history[ticker]['Close'].to_numpy()[-lengths[col]:]
+
+    current_price = closes[-1]
+
+    # Calculate 200 Day Moving Average (a new stock averages all it has)
+    dma_200 = np.nanmean(closes[-200:], axis=0)
+
+    # Calculate Drawdown from 52-week High (approx 252 trading days)
+    year_high = np.nanmax(closes[-252:], axis=0)
+    drawdown = (current_price - year_high) / year_high
+
+    # Determine Status & Multiplier based on Dashboard Rules
+    dma_diff_pct = (current_price - dma_200) / dma_200
+
+    # Logic (first matching rule wins):
+    # 1. > 20% over 200 DMA -> Trim/Hold
+    # 2. < 200 DMA & Drawdown > 20% -> Deep Value
+    # 3. < 200 DMA -> Smart Buy
+    # 4. Otherwise -> Standard
+    # Each mask is evaluated once: being > 20% over the DMA already implies
+    # being above it, and the "below DMA" mask is shared by rules 2 and 3.
+    below_dma = current_price < dma_200
+    rules = [
+        dma_diff_pct > 0.20,
+        below_dma & (drawdown < -0.20),
+        below_dma,
+    ]
+    # One select picks the matching rule; every column is then a lookup
+    rule = np.select(rules, [0, 1, 2], default=3)
+
+    df = pd.DataFrame({
+        "Ticker": symbols,
+        "Price": current_price,
+        "200_DMA": dma_200,
+        "DMA_Diff": dma_diff_pct,
+        "Drawdown": drawdown,
+        "Multiplier": np.array([0.0, 2.0, 1.5, 1.0])[rule],
+        "Status": np.array(["Overextended", "Deep Value Buy", "Smart Buy", "Standard"])[rule],
+        "Badge": np.array(["badge-trim", "badge-deep", "badge-smart", "badge-standard"])[rule]
+    })
+
+    # Card display fields, derived once per fetch instead of on every render
+    delta = df['Price'] - df['200_DMA']
+    df['Delta_Str'] = delta.map(lambda d: f"{'▲' if d >= 0 else '▼'} {d:.2f} vs 200DMA")
+    df['Delta_Class'] = np.where(delta >= 0, "card-up", "card-down")
+    df['Progress'] = np.clip(0.5 + (df['DMA_Diff'] / 0.4), 0.0, 1.0)
+    # '&#36;' rather than '$': two dollar signs in one markdown block would
+    # otherwise be rendered as LaTeX
+    df['Price_Str'] = df['Price'].map('&#36;{:.2f}'.format)
+    df['Drawdown_Str'] = df['Drawdown'].map('{:.1%}'.format)
+    df['Multiplier_Str'] = df['Multiplier'].map('x{}'.format)
+
+    return df
+
+# --- CACHING ---
+# Prices only move during regular trading hours (09:30-16:00 ET, weekdays),
+# so the cache window follows the market clock: a new bucket every minute
+# while the market is open, every 6 hours while it is closed. Passing the
+# bucket into get_market_data makes it part of the cache key.
+def market_cache_bucket():
+    now = datetime.now(MARKET_TZ)
+    market_open = now.replace(hour=9, minute=30, second=0, microsecond=0)
+    market_close = now.replace(hour=16, minute=0, second=0, microsecond=0)
+
+    if now.weekday() < 5 and market_open <= now < market_close:
+        return f"{now:%Y%m%d_%H%M}"
+    return f"{now:%Y%m%d}_{now.hour // 6 * 6:02d}h"
+
+# st.cache_data only lives as long as the Streamlit process. Each result is
+# also written to a parquet file named after its bucket, so a restart or
+# redeploy within the same bucket reads from disk instead of Yahoo.
+def _cache_path(tickers, bucket):
+    key = hashlib.md5(f"{CACHE_VERSION}:{','.join(tickers)}".encode()).hexdigest()[:8]
+    return CACHE_DIR / f"md_{bucket}_{key}.parquet"
+
+def clear_disk_cache():
+    for path in CACHE_DIR.glob("md_*.parquet"):
+        path.unlink(missing_ok=True)
+
+@st.cache_data(max_entries=4)
+def get_market_data(tickers, bucket):
+    cache_path = _cache_path(tickers, bucket)
+    if cache_path.exists():
+        try:
+            return pd.read_parquet(cache_path)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable cache {cache_path.name}: {e}")
+
+    # Raising keeps a failed fetch out of st.cache_data (exceptions are never
+    # cached), so the next rerun tries Yahoo again instead of serving an
+    # empty frame until the bucket rolls over
+    df = build_market_data(tickers)
+    if df.empty:
+        raise MarketDataError("Yahoo returned no usable data")
+
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        clear_disk_cache()  # Older buckets are stale by definition
+        # Write then rename, so other sessions never read a half-written file
+        tmp_path = cache_path.with_suffix(".tmp")
+        df.to_parquet(tmp_path)
+        tmp_path.replace(cache_path)
+    except OSError as e:
+        print(f"Could not write cache {cache_path.name}: {e}")
+
+    return df
+
+# --- CARD RENDERING ---
+# Builds one asset card as a single HTML block for st.markdown
+def render_card_html(ticker, status, badge, price_str, delta_str, delta_class, progress, drawdown_str, multiplier_str, multiplier, invest_amount):
+    # Investment Action
+    if multiplier > 0:
+        action_html = f"<div class='card-action card-invest'>Invest &#36;{invest_amount:.2f}</div>"
+    else:
+        action_html = "<div class='card-action card-hold'>Trim / Hold</div>"
+
+    # Built without newlines/indentation, which markdown would read as a code
+    # block; '&#36;' keeps the dollar signs from being rendered as LaTeX
+    return (
+        "<div class='card'>"
+        f"<div class='card-header'><span class='card-ticker'>{ticker}</span><span class='{badge}'>{status}</span></div>"
+        f"<div class='card-label'>Price</div><div class='card-price'>{price_str}</div>"
+        f"<div class='{delta_class}'>{delta_str}</div>"
+        "<div class='card-label' style='margin-top:12px'>Undervalued ⟵ ⟶ Overvalued</div>"
+        f"<div class='card-bar'><div class='card-bar-fill' style='width:{progress:.0%}'></div></div>"
+        "<div class='card-stats'>"
+        f"<div><div class='card-label'>Drawdown</div><b>{drawdown_str}</b></div>"
+        f"<div><div class='card-label'>Multiplier</div><b>{multiplier_str}</b></div>"
+        "</div>"
+        f"{action_html}"
+        "</div>"
+    )
+
+# --- DASHBOARD ---
+# The frame is kept in session_state until the cache bucket rolls over, so
+# ordinary reruns reuse the live object and skip st.cache_data's argument
+# hashing and copy of the returned DataFrame. Failures are not stored, so
+# the next rerun tries again.
+def load_market_data():
+    md_key = (tuple(TICKERS), market_cache_bucket())
+    if st.session_state.get('md_key') != md_key:
+        with st.spinner("Fetching market data..."):
+            df = get_market_data(TICKERS, md_key[1])
+        st.session_state['md'] = df
+        st.session_state['md_key'] = md_key
+    return st.session_state['md']
+
+# Everything driven by the contribution input lives in one fragment, so
+# editing the amount reruns only the control panel and the card grid rather
+# than the whole script (header and all).
+@st.fragment
+def render_dashboard():
+    # Widget interactions only rerun this fragment, so the bucket is checked
+    # here as well; on a failed reload the last good frame stays up.
+    try:
+        df = load_market_data()
+    except MarketDataError:
+        df = st.session_state['md']
 
     # Control Panel
     # Using container with border ensuring visibility in light/dark mode
@@ -121,19 +295,12 @@ def main():
         with c1:
             base_contribution = st.number_input("Base Monthly Contribution ($)", value=1000, step=100)
         
-        # Calculate Logic
-        with st.spinner("Fetching market data..."):
-            df = get_market_data(TICKERS)
-        
-        if df.empty:
-            st.error("Could not fetch data. Please check your internet connection or try again later.")
-            return
-
         # Base allocation per asset (Equal Weight Base)
         base_per_asset = base_contribution / len(df)
         
         # Calculate individual investments
-        df['Invest_Amount'] = base_per_asset * df['Multiplier']
+        # (assign returns a copy, so the cached frame is never mutated)
+        df = df.assign(Invest_Amount=base_per_asset * df['Multiplier'])
         
         total_smart_dca = df['Invest_Amount'].sum()
         active_multiplier = total_smart_dca / base_contribution if base_contribution > 0 else 0
@@ -153,7 +320,9 @@ def main():
     st.info("Strategy Legend: < 200DMA (1.5x) | Deep Value < 200DMA & >20% DD (2.0x) | Standard (1.0x) | Overextended > 20% over 200DMA (0.0x)", icon="ℹ️")
 
     # --- TABS FOR FILTERING ---
-    tab1, tab2, tab3, tab4 = st.tabs(["All Assets", "Opportunities", "Standard", "Hold/Trim"])
+    # A horizontal radio rather than st.tabs: st.tabs builds the content of
+    # every tab on each run, while this only renders the selected view.
+    view = st.radio("View", ["All Assets", "Opportunities", "Standard", "Hold/Trim"], horizontal=True, key='tab', label_visibility="collapsed")
 
     def render_grid(dataframe):
         if dataframe.empty:
@@ -161,54 +330,67 @@ def main():
             return
 
         # Create a grid layout
-        # We calculate rows to ensure layout stays clean
-        cols_per_row = 4
-        rows = [dataframe.iloc[i:i + cols_per_row] for i in range(0, len(dataframe), cols_per_row)]
-
-        for row_data in rows:
-            cols = st.columns(cols_per_row)
-            for idx, (index, asset) in enumerate(row_data.iterrows()):
-                with cols[idx]:
-                    # Card Container
-                    with st.container(border=True):
-                        # Header: Ticker + Badge
-                        h1, h2 = st.columns([1, 2])
-                        with h1:
-                            st.subheader(asset['Ticker'])
-                        with h2:
-                            st.markdown(f"<div style='text-align:right'><span class='{asset['Badge']}'>{asset['Status']}</span></div>", unsafe_allow_html=True)
-                        
-                        # Price Data
-                        st.metric("Price", f"${asset['Price']:.2f}", f"{(asset['Price'] - asset['200_DMA']):.2f} vs 200DMA")
-                        
-                        # Progress Bar logic
-                        progress_val = 0.5 + (asset['DMA_Diff'] / 0.4) 
-                        progress_val = max(0.0, min(1.0, progress_val))
-                        st.progress(progress_val, text="Undervalued ⟵ ⟶ Overvalued")
-
-                        # Drawdown & Multiplier
-                        d1, d2 = st.columns(2)
-                        with d1:
-                            st.text("Drawdown")
-                            st.markdown(f"**{asset['Drawdown']:.1%}**")
-                        with d2:
-                            st.text("Multiplier")
-                            st.markdown(f"**x{asset['Multiplier']}**")
-                        
-                        # Investment Action
-                        if asset['Multiplier'] > 0:
-                            st.success(f"Invest ${asset['Invest_Amount']:.2f}")
-                        else:
-                            st.warning("Trim / Hold")
-
-    with tab1:
+        # The whole grid is one markdown call: CSS grid lays the cards out
+        # 4 per row and stacks them on narrow screens. Rows are read as plain
+        # dicts rather than via iterrows(), which builds a Series per row.
+        cards = "".join(
+            render_card_html(
+                ticker=asset['Ticker'],
+                status=asset['Status'],
+                badge=asset['Badge'],
+                price_str=asset['Price_Str'],
+                delta_str=asset['Delta_Str'],
+                delta_class=asset['Delta_Class'],
+                progress=asset['Progress'],
+                drawdown_str=asset['Drawdown_Str'],
+                multiplier_str=asset['Multiplier_Str'],
+                multiplier=asset['Multiplier'],
+                invest_amount=asset['Invest_Amount']
+            )
+            for asset in dataframe.to_dict('records')
+        )
+        st.markdown(f"<div class='card-grid'>{cards}</div>", unsafe_allow_html=True)
+
+    if view == "All Assets":
         render_grid(df)
-    with tab2:
+    elif view == "Opportunities":
         render_grid(df[df['Multiplier'] > 1.0])
-    with tab3:
+    elif view == "Standard":
         render_grid(df[df['Multiplier'] == 1.0])
-    with tab4:
+    else:
         render_grid(df[df['Multiplier'] == 0.0])
 
+# --- MAIN APP ---
+def main():
+    # Header Section
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.title("Smart DCA Dashboard")
+        st.caption("Live Market Data via Yahoo Finance")
+    with col2:
+        if st.button("🔄 Refresh Data"):
+            st.cache_data.clear()
+            clear_disk_cache()
+            st.session_state.pop('md_key', None)
+            st.rerun()
+
+    # Top Metrics
+    col_m1, col_m2 = st.columns(2)
+    with col_m1:
+        st.markdown("**Fear & Greed:** <span style='color:orange'>49 Neutral</span>", unsafe_allow_html=True)
+    with col_m2:
+        st.markdown("**Shiller PE:** <span style='color:red'>39.85 Overvalued</span>", unsafe_allow_html=True)
+    
+    st.divider()
+
+    # Fetch Data
+    try:
+        load_market_data()
+    except MarketDataError:
+        st.error("Could not fetch data. Please check your internet connection or try again later.")
+        return
+
+    render_dashboard()
+
 if __name__ == "__main__":
     main()